@@ -7,23 +7,40 @@ Conversational CLI chatbot with HITL email draft review.
 
 Usage:
   python main.py
+  python main.py --llm-polish    # rewrite the template email draft with GPT-4o-mini
 """
 
 from __future__ import annotations
+import argparse
+import collections
 import functools
+import logging
+import operator
 import os
 import re
+import sys
 import uuid
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Literal, Optional
+from typing import Annotated, Any, Deque, Dict, Iterable, Iterator, List, Literal, Optional
 
+import httpx
 from dotenv import load_dotenv
+from langgraph.cache.memory import InMemoryCache
 from langgraph.graph import StateGraph, END
+from langgraph.types import CachePolicy
 from openai import OpenAI
 from typing_extensions import TypedDict
 
 load_dotenv()
 
+# LOG_LEVEL applies to the app's own logger only. The root stays at WARNING:
+# at DEBUG, library loggers (hpack, httpx, openai) dump request headers,
+# including the API key.
+logging.basicConfig(level=logging.WARNING)
+log = logging.getLogger("appt")
+_log_level = logging.getLevelName(os.getenv("LOG_LEVEL", "WARNING").strip().upper())
+log.setLevel(_log_level if isinstance(_log_level, int) else logging.WARNING)
+
 # ═══════════════════════════════════════════════════════════════════
 # CONFIG
 # ═══════════════════════════════════════════════════════════════════
@@ -31,6 +48,7 @@ load_dotenv()
 CLINIC_NAME  = "Medical Clinic"
 CLINIC_EMAIL = "appointments@medicalclinic.com"
 MODEL        = "gpt-4o-mini"
+MAX_MESSAGES = 50    # conversation history kept per session
 
 # Validate API key early and clearly
 _api_key = os.getenv("OPENAI_API_KEY", "").strip()
@@ -40,7 +58,14 @@ if not _api_key or _api_key == "your-key-here":
     print("  OPENAI_API_KEY=sk-proj-...\n")
     exit(1)
 
-_openai = OpenAI(api_key=_api_key)
+# Bounded timeout so a hung request can't freeze the CLI; the keep-alive pool
+# lets later drafts in the session skip the TCP/TLS handshake
+_openai = OpenAI(
+    api_key=_api_key,
+    timeout=15.0,
+    max_retries=2,
+    http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60.0)),
+)
 
 DIVIDER = "─" * 60
 BOLD    = "\033[1m"
@@ -57,7 +82,7 @@ RESET   = "\033[0m"
 class ChatState(TypedDict, total=False):
     # Conversation
     session_id:       str
-    messages:         List[Dict[str, str]]   # [{role, content}, ...]
+    messages:         Deque[Dict[str, str]]  # [{role, content}, ...], last MAX_MESSAGES only
     current_input:    str
 
     # Intent detection
@@ -76,10 +101,11 @@ class ChatState(TypedDict, total=False):
     email_draft:      str
     hitl_approved:    Optional[bool]
     hitl_note:        str
+    llm_polish:       bool   # rewrite the template draft with GPT
 
     # Flow control
     bot_reply:        str
-    route_taken:      List[str]
+    route_taken:      Annotated[List[str], operator.add]   # nodes return only their own step
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -92,70 +118,188 @@ def bot_print(msg: str):
 def user_input(prompt: str = "") -> str:
     return input(f"  {BOLD}You:{RESET} ").strip()
 
+def stream_print(chunks: Iterable[str], parts: Optional[List[str]] = None) -> str:
+    """Echo text to the terminal as it arrives and return the full text.
+
+    Pass ``parts`` to see what was already shown if ``chunks`` raises mid-stream.
+    """
+    parts = [] if parts is None else parts
+    sys.stdout.write("  ")
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            sys.stdout.write(chunk.replace("\n", "\n  "))
+            sys.stdout.flush()
+    finally:
+        sys.stdout.write("\n")
+    return "".join(parts).strip()
+
+EMERGENCY_KEYWORDS = (
+    "emergency", "urgent", "heart attack", "chest pain", "stroke", "dying", "can't breathe",
+    "bleeding", "unconscious", "911", "severe", "critical", "collapsed", "seizure", "overdose",
+    "not breathing", "passed out", "severe pain",
+)
+
+# Confirms word boundaries once the cheap substring scan has found a candidate
 EMERGENCY_RE = re.compile(
-    r"\b(emergency|urgent|heart attack|chest pain|stroke|dying|can't breathe|"
-    r"bleeding|unconscious|911|severe|critical|collapsed|seizure|overdose|"
-    r"not breathing|passed out|severe pain)\b",
+    r"\b(" + "|".join(re.escape(kw) for kw in EMERGENCY_KEYWORDS) + r")\b",
     re.IGNORECASE,
 )
 
+def is_emergency(text: str) -> bool:
+    lower = text.lower()
+    # Non-ASCII text goes straight to the regex: IGNORECASE folds "İ" to "i", lower() doesn't
+    if text.isascii() and not any(kw in lower for kw in EMERGENCY_KEYWORDS):
+        return False
+    return EMERGENCY_RE.search(text) is not None
+
 INTENT_PATTERNS = {
     "book":       [r"\b(book|schedule|make|new|set up)\b.*\bappointment\b", r"\bappointment\b.*\b(book|schedule|make)\b", r"\bi (need|want|would like).*(appointment|see (a |the )?doctor)"],
     "cancel":     [r"\b(cancel|remove|drop|delete)\b.*\bappointment\b", r"\bappointment\b.*\b(cancel|remove|drop)\b", r"\bcancel\b"],
     "reschedule": [r"\b(reschedule|move|change|shift|postpone|rebook)\b.*\bappointment\b", r"\bappointment\b.*\b(reschedule|move|change)\b", r"\breschedule\b"],
 }
 
+# One compiled alternation per intent, checked in the order above
+INTENT_REGEX = [
+    (intent, re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE))
+    for intent, patterns in INTENT_PATTERNS.items()
+]
+
+@functools.lru_cache(maxsize=256)
 def detect_intent(text: str) -> str:
-    if EMERGENCY_RE.search(text):
+    if is_emergency(text):
         return "emergency"
-    t = text.lower()
-    for intent, patterns in INTENT_PATTERNS.items():
-        for p in patterns:
-            if re.search(p, t):
-                return intent
+    for intent, rx in INTENT_REGEX:
+        if rx.search(text):
+            return intent
     return "unknown"
 
+# Name parts are split on whitespace, hyphens and apostrophes
+_NAME_PART_RE = re.compile(r"[^\s\-'’]+")
+
+def _titlecase(s: str) -> str:
+    # "mary-jane  o'brien" -> "Mary-Jane O'Brien"; unlike str.title(), a part
+    # starting with a digit is left alone ("3rd" stays "3rd", not "3Rd")
+    return _NAME_PART_RE.sub(lambda m: m.group().capitalize(), " ".join(s.split()))
+
+APPROVE_TOKENS = frozenset({"yes", "y", "send", "confirm", "looks good", "correct", "ok", "sure", "yeah", "yep"})
+REJECT_TOKENS  = frozenset({"no", "n", "edit", "change", "redo", "wrong", "incorrect", "restart"})
+
 
 # ═══════════════════════════════════════════════════════════════════
 # GPT CALL
 # ═══════════════════════════════════════════════════════════════════
 
-def gpt_reply(system: str, user: str) -> str:
+def _log_cache_usage(usage) -> None:
+    # cached_tokens > 0 means OpenAI served the stable prompt prefix from its cache
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    if details is not None:
+        log.debug("OpenAI prompt_tokens=%s cached_tokens=%s", usage.prompt_tokens, details.cached_tokens)
+
+
+def gpt_reply(system: str, user: str, max_tokens: int = 400, temperature: float = 0.4) -> str:
     resp = _openai.chat.completions.create(
         model=MODEL,
         messages=[
             {"role": "system",  "content": system},
             {"role": "user",    "content": user},
         ],
-        temperature=0.4,
-        max_tokens=400,
+        temperature=temperature,
+        max_tokens=max_tokens,
     )
+    _log_cache_usage(resp.usage)
     return resp.choices[0].message.content.strip()
 
 
-def draft_email(state: Dict) -> str:
-    intent   = state.get("intent", "book")
-    name     = state.get("patient_name", "")
-    phone    = state.get("patient_phone", "")
-    day      = state.get("preferred_day", "")
-    time_    = state.get("preferred_time", "")
+def gpt_reply_stream(system: str, user: str, max_tokens: int = 400, temperature: float = 0.4) -> Iterator[str]:
+    stream = _openai.chat.completions.create(
+        model=MODEL,
+        messages=[
+            {"role": "system",  "content": system},
+            {"role": "user",    "content": user},
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        stream_options={"include_usage": True},   # usage arrives on a final, choice-less chunk
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if chunk.usage:
+            _log_cache_usage(chunk.usage)
+
+
+EMAIL_TEMPLATE = """Subject: {subject} — {name}
+
+Dear {clinic} Team,
+
+I would like to {action} an appointment on {day} at {time}.
+
+Name:  {name}
+Phone: {phone}
+
+Please contact me to confirm.
 
+Thank you,
+{name}"""
+
+def render_email(*, intent: str, name: str, phone: str, day: str, time_: str) -> str:
     action = {"book": "book", "cancel": "cancel", "reschedule": "reschedule"}.get(intent, "book")
     subject_action = {"book": "New Appointment Request", "cancel": "Appointment Cancellation Request", "reschedule": "Appointment Reschedule Request"}.get(intent, "Appointment Request")
+    return EMAIL_TEMPLATE.format(subject=subject_action, clinic=CLINIC_NAME, action=action, name=name, phone=phone, day=day, time=time_)
+
 
-    system = f"""You are drafting a professional email on behalf of a patient to {CLINIC_NAME}.
-Write a brief, warm, professional email. Include all the patient details provided.
+# Kept byte-identical across calls so the API can reuse its cached prefix
+POLISH_SYSTEM_PROMPT = f"""You are polishing an email a patient is sending to {CLINIC_NAME} at {CLINIC_EMAIL}.
+Rewrite it to be brief, warm and professional. Keep every patient detail exactly as given.
 Format: start with 'Subject: ...' on the first line, then a blank line, then the email body.
 Sign off as the patient."""
 
-    user = f"""Draft an email to {CLINIC_EMAIL} to {action} an appointment.
-Patient name: {name}
-Patient phone: {phone}
-Preferred day: {day}
-Preferred time: {time_}
-Clinic: {CLINIC_NAME}"""
 
-    return gpt_reply(system, user)
+def polish_email(email: str) -> Iterator[str]:
+    # Drafts run ~150 tokens; a tight cap and low temperature keep latency down
+    return gpt_reply_stream(POLISH_SYSTEM_PROMPT, email, max_tokens=200, temperature=0.2)
+
+
+# ═══════════════════════════════════════════════════════════════════
+# REPLY TEMPLATES
+# ═══════════════════════════════════════════════════════════════════
+
+# ANSI codes are baked in at import; only {placeholders} are filled per turn
+REPLY_EMERGENCY = (
+    f"{RED}{BOLD}🚨 EMERGENCY — Please call 911 immediately!{RESET}\n\n"
+    f"  If you are experiencing a medical emergency, call 911 now\n"
+    f"  or go to your nearest emergency room. Do not wait.\n\n"
+    f"  Once you are safe, come back and I can help you book a follow-up."
+)
+REPLY_MENU = (
+    "I can help you with:\n\n"
+    "  📅  Book an appointment\n"
+    "  🔄  Reschedule an appointment\n"
+    "  ❌  Cancel an appointment\n\n"
+    "  Just type what you need!"
+)
+REPLY_ASK_NAME        = f"I can help you {{action}} an appointment. Let's get a few details first.\n\n  What is your {BOLD}full name{RESET}?"
+REPLY_ASK_PHONE       = f"Thanks, {BOLD}{{name}}{RESET}! What is your {BOLD}phone number{RESET}?"
+REPLY_ASK_DAY         = f"Got it! What is your {BOLD}preferred day{RESET}? (e.g. next Monday, March 5)"
+REPLY_ASK_DAY_CANCEL  = f"Got it! What is the {BOLD}date of the appointment{RESET} you want to cancel? (e.g. next Monday, March 5)"
+REPLY_ASK_TIME        = f"And what is your {BOLD}preferred time{RESET}? (e.g. 10:00 AM, afternoon)"
+REPLY_ASK_TIME_CANCEL = f"And what {BOLD}time{RESET} was the appointment? (e.g. 2:00 PM, afternoon)"
+REPLY_CONFIRM_DRAFT   = f"{BOLD}Does this look correct? (yes to send / no to edit){RESET}"
+REPLY_SENT = (
+    f"{GREEN}✅ Email sent to {CLINIC_EMAIL}!{RESET}\n\n"
+    f"  Your request has been submitted. A team member will\n"
+    f"  contact {BOLD}{{name}}{RESET} at {BOLD}{{phone}}{RESET} to confirm.\n\n"
+    f"  Is there anything else I can help you with?\n"
+    f"  (book / reschedule / cancel)"
+)
+REPLY_RESTART = (
+    "No problem! Let's start over.\n\n"
+    "  What would you like to do?\n"
+    "  (book / reschedule / cancel an appointment)"
+)
+REPLY_YES_NO = f"Please reply {BOLD}yes{RESET} to send the email, or {BOLD}no{RESET} to start over."
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -165,50 +309,34 @@ Clinic: {CLINIC_NAME}"""
 def node_detect_intent(state: Dict) -> Dict:
     text   = state.get("current_input", "")
     intent = detect_intent(text)
-    route  = list(state.get("route_taken", []))
-    route.append("detect_intent")
+    route  = ["detect_intent"]
 
     if intent == "emergency":
-        reply = (
-            f"{RED}{BOLD}🚨 EMERGENCY — Please call 911 immediately!{RESET}\n\n"
-            f"  If you are experiencing a medical emergency, call 911 now\n"
-            f"  or go to your nearest emergency room. Do not wait.\n\n"
-            f"  Once you are safe, come back and I can help you book a follow-up."
-        )
-        return {"intent": intent, "stage": "done", "bot_reply": reply, "route_taken": route}
+        return {"intent": intent, "stage": "done", "bot_reply": REPLY_EMERGENCY, "route_taken": route}
 
     if intent == "unknown":
-        reply = (
-            "I can help you with:\n\n"
-            f"  📅  Book an appointment\n"
-            f"  🔄  Reschedule an appointment\n"
-            f"  ❌  Cancel an appointment\n\n"
-            f"  Just type what you need!"
-        )
-        return {"intent": intent, "stage": "detect", "bot_reply": reply, "route_taken": route}
+        return {"intent": intent, "stage": "detect", "bot_reply": REPLY_MENU, "route_taken": route}
 
     action_label = {"book": "book", "cancel": "cancel", "reschedule": "reschedule"}[intent]
-    reply = f"I can help you {action_label} an appointment. Let's get a few details first.\n\n  What is your {BOLD}full name{RESET}?"
+    reply = REPLY_ASK_NAME.format(action=action_label)
     return {"intent": intent, "stage": "collect_name", "bot_reply": reply, "route_taken": route}
 
 
 def node_collect_name(state: Dict) -> Dict:
     name  = state.get("current_input", "").strip()
-    route = list(state.get("route_taken", []))
-    route.append("collect_name")
+    route = ["collect_name"]
 
     if len(name) < 2:
         return {"bot_reply": "Please enter your full name.", "stage": "collect_name", "route_taken": route}
 
-    reply = f"Thanks, {BOLD}{name}{RESET}! What is your {BOLD}phone number{RESET}?"
-    return {"patient_name": name.title(), "stage": "collect_phone", "bot_reply": reply, "route_taken": route}
+    reply = REPLY_ASK_PHONE.format(name=name)
+    return {"patient_name": _titlecase(name), "stage": "collect_phone", "bot_reply": reply, "route_taken": route}
 
 
 def node_collect_phone(state: Dict) -> Dict:
     raw   = state.get("current_input", "")
-    route = list(state.get("route_taken", []))
-    route.append("collect_phone")
-    digits = re.sub(r"\D", "", raw)
+    route = ["collect_phone"]
+    digits = "".join(filter(str.isdecimal, raw))
 
     if len(digits) < 7:
         return {"bot_reply": "Please enter a valid phone number (e.g. 902-555-0123).", "stage": "collect_phone", "route_taken": route}
@@ -221,97 +349,82 @@ def node_collect_phone(state: Dict) -> Dict:
         phone = raw.strip()
 
     intent = state.get("intent", "book")
-    if intent == "cancel":
-        reply = f"Got it! What is the {BOLD}date of the appointment{RESET} you want to cancel? (e.g. next Monday, March 5)"
-    else:
-        reply = f"Got it! What is your {BOLD}preferred day{RESET}? (e.g. next Monday, March 5)"
+    reply  = REPLY_ASK_DAY_CANCEL if intent == "cancel" else REPLY_ASK_DAY
 
     return {"patient_phone": phone, "stage": "collect_day", "bot_reply": reply, "route_taken": route}
 
 
 def node_collect_day(state: Dict) -> Dict:
     day   = state.get("current_input", "").strip()
-    route = list(state.get("route_taken", []))
-    route.append("collect_day")
+    route = ["collect_day"]
 
     if len(day) < 2:
         return {"bot_reply": "Please enter a preferred day or date.", "stage": "collect_day", "route_taken": route}
 
     intent = state.get("intent", "book")
-    if intent == "cancel":
-        reply = f"And what {BOLD}time{RESET} was the appointment? (e.g. 2:00 PM, afternoon)"
-    else:
-        reply = f"And what is your {BOLD}preferred time{RESET}? (e.g. 10:00 AM, afternoon)"
+    reply  = REPLY_ASK_TIME_CANCEL if intent == "cancel" else REPLY_ASK_TIME
 
     return {"preferred_day": day, "stage": "collect_time", "bot_reply": reply, "route_taken": route}
 
 
 def node_collect_time(state: Dict) -> Dict:
     time_ = state.get("current_input", "").strip()
-    route = list(state.get("route_taken", []))
-    route.append("collect_time")
+    route = ["collect_time"]
 
     if len(time_) < 2:
         return {"bot_reply": "Please enter a preferred time.", "stage": "collect_time", "route_taken": route}
 
     # All info collected — generate email draft
-    updated = dict(state)
-    updated["preferred_time"] = time_
-    updated["route_taken"]    = route
+    intent = state.get("intent", "book")
+    name   = state.get("patient_name", "")
+    phone  = state.get("patient_phone", "")
+    day    = state.get("preferred_day", "")
 
-    bot_print("Got everything I need. Drafting your email with GPT-4o-mini...")
-    try:
-        email = draft_email(updated)
-    except Exception as e:
-        email = f"Subject: Appointment Request — {updated.get('patient_name', '')}\n\nDear {CLINIC_NAME} Team,\n\nPatient {updated.get('patient_name','')} ({updated.get('patient_phone','')}) would like to {updated.get('intent','book')} an appointment on {updated.get('preferred_day','')} at {updated.get('preferred_time','')}.\n\nPlease contact the patient to confirm.\n\nThank you."
-
-    reply = (
-        f"Here is the email draft:\n\n"
-        f"{DIVIDER}\n"
-        f"  To : {CLINIC_EMAIL}\n"
-        f"{DIVIDER}\n"
-    )
-    for line in email.splitlines():
-        reply += f"  {line}\n"
-    reply += f"{DIVIDER}\n\n"
-    reply += f"  {BOLD}Does this look correct? (yes to send / no to edit){RESET}"
+    # The template is the draft; GPT only rewrites it when --llm-polish is set
+    email = render_email(intent=intent, name=name, phone=phone, day=day, time_=time_)
+
+    if state.get("llm_polish"):
+        bot_print("Got everything I need. Polishing your email with GPT-4o-mini...")
+    else:
+        bot_print("Got everything I need.")
+    print(f"  Here is the email draft:\n\n{DIVIDER}\n  To : {CLINIC_EMAIL}\n{DIVIDER}")
+    if state.get("llm_polish"):
+        # Streamed so the rewrite renders as it is generated
+        shown = []
+        try:
+            email = stream_print(polish_email(email), shown)
+        except Exception:
+            if shown:
+                # Part of the rewrite is already on screen; set it apart from the draft that follows
+                print(f"{DIVIDER}\n  Rewrite failed — using the template draft instead.\n{DIVIDER}")
+            stream_print([email])
+    else:
+        stream_print([email])
+    print(DIVIDER)
 
-    route.append("collect_time")
     return {
         "preferred_time": time_,
         "email_draft":    email,
         "stage":          "hitl_review",
-        "bot_reply":      reply,
+        "bot_reply":      REPLY_CONFIRM_DRAFT,
         "route_taken":    route,
     }
 
 
 def node_hitl_review(state: Dict) -> Dict:
     answer = state.get("current_input", "").strip().lower()
-    route  = list(state.get("route_taken", []))
-    route.append("hitl_review")
+    route  = ["hitl_review"]
 
-    approved = answer in ("yes", "y", "send", "confirm", "looks good", "correct", "ok", "sure", "yeah", "yep")
-    rejected = answer in ("no", "n", "edit", "change", "redo", "wrong", "incorrect", "restart")
+    approved = answer in APPROVE_TOKENS
+    rejected = answer in REJECT_TOKENS
 
     if approved:
         name  = state.get("patient_name", "")
         phone = state.get("patient_phone", "")
-        reply = (
-            f"{GREEN}✅ Email sent to {CLINIC_EMAIL}!{RESET}\n\n"
-            f"  Your request has been submitted. A team member will\n"
-            f"  contact {BOLD}{name}{RESET} at {BOLD}{phone}{RESET} to confirm.\n\n"
-            f"  Is there anything else I can help you with?\n"
-            f"  (book / reschedule / cancel)"
-        )
+        reply = REPLY_SENT.format(name=name, phone=phone)
         return {"hitl_approved": True, "stage": "done", "bot_reply": reply, "route_taken": route}
 
     if rejected:
-        reply = (
-            f"No problem! Let's start over.\n\n"
-            f"  What would you like to do?\n"
-            f"  (book / reschedule / cancel an appointment)"
-        )
         return {
             "hitl_approved": False,
             "stage":         "detect",
@@ -320,13 +433,13 @@ def node_hitl_review(state: Dict) -> Dict:
             "preferred_day": "",
             "preferred_time":"",
             "email_draft":   "",
-            "bot_reply":     reply,
+            "bot_reply":     REPLY_RESTART,
             "route_taken":   route,
         }
 
     # Unclear answer
     return {
-        "bot_reply":    f"Please reply {BOLD}yes{RESET} to send the email, or {BOLD}no{RESET} to start over.",
+        "bot_reply":    REPLY_YES_NO,
         "stage":        "hitl_review",
         "route_taken":  route,
     }
@@ -339,17 +452,34 @@ def node_hitl_review(state: Dict) -> Dict:
 def route_by_stage(state: Dict) -> str:
     return state.get("stage", "detect")
 
+# Each turn runs exactly one node chosen by stage, so main() dispatches here
+# directly; the compiled graph mirrors this table for visualization/debugging
+STAGE_TO_NODE = {
+    "detect":        node_detect_intent,
+    "collect_name":  node_collect_name,
+    "collect_phone": node_collect_phone,
+    "collect_day":   node_collect_day,
+    "collect_time":  node_collect_time,
+    "hitl_review":   node_hitl_review,
+}
+
 
 # ═══════════════════════════════════════════════════════════════════
 # GRAPH BUILDER
 # ═══════════════════════════════════════════════════════════════════
 
+@functools.lru_cache(maxsize=1)
 def build_graph():
     graph = StateGraph(ChatState)
 
-    graph.add_node("detect_intent",  node_detect_intent)
-    graph.add_node("collect_name",   node_collect_name)
-    graph.add_node("collect_phone",  node_collect_phone)
+    # These nodes are pure functions of the input (plus intent for phone), so
+    # a retyped answer is served from the node cache
+    by_input = CachePolicy(key_func=lambda s: s.get("current_input", ""))
+    by_intent_input = CachePolicy(key_func=lambda s: f"{s.get('intent', '')}\0{s.get('current_input', '')}")
+
+    graph.add_node("detect_intent",  node_detect_intent, cache_policy=by_input)
+    graph.add_node("collect_name",   node_collect_name,  cache_policy=by_input)
+    graph.add_node("collect_phone",  node_collect_phone, cache_policy=by_intent_input)
     graph.add_node("collect_day",    node_collect_day)
     graph.add_node("collect_time",   node_collect_time)
     graph.add_node("hitl_review",    node_hitl_review)
@@ -376,7 +506,7 @@ def build_graph():
     for node in ["detect_intent","collect_name","collect_phone","collect_day","collect_time","hitl_review"]:
         graph.add_edge(node, END)
 
-    return graph.compile()
+    return graph.compile(cache=InMemoryCache())
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -384,14 +514,16 @@ def build_graph():
 # ═══════════════════════════════════════════════════════════════════
 
 def main():
+    parser = argparse.ArgumentParser(description=f"{CLINIC_NAME} appointment assistant")
+    parser.add_argument("--llm-polish", action="store_true", help="rewrite the template email draft with GPT-4o-mini")
+    args = parser.parse_args()
+
     print(f"\n{DIVIDER}")
     print(f"  {BOLD}{GREEN}🏥 {CLINIC_NAME} — Appointment Assistant{RESET}")
     print(f"{DIVIDER}")
     print(f"  Powered by LangGraph + GPT-4o-mini")
     print(f"  Type 'quit' to exit\n{DIVIDER}\n")
 
-    graph = build_graph()
-
     # Initial greeting
     bot_print(
         f"Hello! Welcome to {BOLD}{CLINIC_NAME}{RESET} 👋\n\n"
@@ -407,12 +539,13 @@ def main():
         "session_id":    str(uuid.uuid4())[:8].upper(),
         "stage":         "detect",
         "route_taken":   [],
-        "messages":      [],
+        "messages":      collections.deque(maxlen=MAX_MESSAGES),
         "patient_name":  "",
         "patient_phone": "",
         "preferred_day": "",
         "preferred_time":"",
         "email_draft":   "",
+        "llm_polish":    args.llm_polish,
     }
 
     while True:
@@ -428,13 +561,15 @@ def main():
             print(f"\n  Goodbye! Have a great day. 👋\n")
             break
 
-        # Inject user input and run one graph step
+        # Inject user input and run this stage's node
         state["current_input"] = user_text
         state["messages"].append({"role": "user", "content": user_text})
 
-        result = graph.invoke(state)
+        node_fn = STAGE_TO_NODE[state["stage"]]
+        result  = node_fn(state)
 
-        # Merge result back into persistent state
+        # Merge result back into persistent state (route_taken is append-only)
+        state["route_taken"].extend(result.pop("route_taken", []))
         state.update(result)
 
         # Print bot reply
@@ -2,44 +2,73 @@
 """
 server.py
 =========
-Flask server that:
+Async Quart server that:
   - Serves frontend.html at /
   - Exposes POST /api/chat  → runs LangGraph pipeline → returns bot reply
+  - Exposes POST /api/chat/stream → same pipeline, reply streamed as SSE
   - Exposes POST /api/email → generates GPT-4o-mini email draft
+  - Exposes POST /api/email/bulk → queues many drafts on the OpenAI Batch API
 
 Usage:
-  pip install flask flask-cors
-  python server.py
+  pip install quart quart-cors uvicorn orjson pyahocorasick "httpx[http2]"
+  python server.py                                   # development (QUART_DEBUG=1 for the debugger)
+  uvicorn server:app --workers 4 --port 8080         # production
   Then open http://localhost:8080
 """
 
 from __future__ import annotations
+import asyncio
+import contextlib
 import functools
-import json
+import logging
 import os
 import re
+import sqlite3
+import threading
+import time
 import uuid
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
 
+import ahocorasick
+import httpx
+import orjson
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request, send_from_directory
-from flask_cors import CORS
 from langgraph.graph import StateGraph, END
-from openai import OpenAI
+from openai import AsyncOpenAI
+from quart import Quart, Response, abort, request, send_from_directory
+from quart_cors import cors
 from typing_extensions import TypedDict
 
 load_dotenv()
 
+# LOG_LEVEL applies to the app's own logger only. The root stays at WARNING:
+# at DEBUG, library loggers (hpack, httpx, openai) dump request headers,
+# including the API key.
+logging.basicConfig(level=logging.WARNING)
+log = logging.getLogger("appt")
+_log_level = logging.getLevelName(os.getenv("LOG_LEVEL", "WARNING").strip().upper())
+log.setLevel(_log_level if isinstance(_log_level, int) else logging.WARNING)
+
 # ── Validate API key ──────────────────────────────────────────────
 _api_key = os.getenv("OPENAI_API_KEY", "").strip()
 if not _api_key or _api_key == "your-key-here":
     print("\n  ❌  ERROR: No OpenAI API key found in .env\n")
     exit(1)
 
-_openai  = OpenAI(api_key=_api_key)
-app      = Flask(__name__, static_folder=".")
-CORS(app)
+# Async client: requests waiting on OpenAI share the event loop instead of
+# each holding a worker thread for the whole round trip. One pooled HTTP/2
+# client multiplexes concurrent calls over kept-alive TLS connections.
+_http    = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=httpx.Timeout(30.0, connect=2.0),
+)
+_openai  = AsyncOpenAI(api_key=_api_key, http_client=_http)
+app      = cors(Quart(__name__, static_folder="."))
+
+# Resolved once; nothing per request needs to touch the filesystem to find it
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 CLINIC_NAME  = "Medical Clinic"
 CLINIC_EMAIL = "appointments@medicalclinic.com"
@@ -47,6 +76,12 @@ MODEL        = "gpt-4o-mini"
 MAX_CALLS    = 15
 MAX_CHARS    = 2000
 
+# Micro-batching of /api/chat replies (0 = off). Off by default: a batch puts
+# several patients' messages in one prompt, so enable it only when throughput
+# under the rate limit matters more than that isolation.
+BATCH_WINDOW_MS = int(os.getenv("CHAT_BATCH_WINDOW_MS", "0"))
+MAX_BATCH       = 16
+
 
 # ═══════════════════════════════════════════════════════════════════
 # STATE
@@ -70,36 +105,50 @@ class AppointmentState(TypedDict, total=False):
     status:             str
     route_taken:        List[str]
     error:              str
+    scan:               Dict[str, Any]   # scan_message() output, computed once per request
 
 
 # ═══════════════════════════════════════════════════════════════════
 # MIDDLEWARE
 # ═══════════════════════════════════════════════════════════════════
 
-def _log(label: str, msg: str):
-    print(f"  [MIDDLEWARE:{label}] {msg}")
+def _log(label: str, msg: str, *args):
+    # Lazy: nothing is formatted unless DEBUG is on (LOG_LEVEL=DEBUG)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("[MIDDLEWARE:" + label + "] " + msg, *args)
+
+# Compiled once at import; scan_message() runs these once per request
+_MOD_WORDS = ("bomb", "weapon", "kill", "suicide", "abuse", "hack", "exploit", "injection")
+_MOD_RE    = re.compile(r"\b(" + "|".join(_MOD_WORDS) + r")\b", re.IGNORECASE)
+_PII_RULES = {
+    "ssn":   re.compile(r"\b\d{3}-\d{2}-\d{4}\b"),
+    "dob":   re.compile(r"\b\d{1,2}/\d{1,2}/\d{4}\b"),
+    "phone": re.compile(r"\b\(?\d{3}\)?[\s\-]\d{3}[\s\-]\d{4}\b"),
+    "email": re.compile(r"\b[\w.+-]+@[\w-]+\.\w+\b"),
+    "mrn":   re.compile(r"\bMRN[:\s]?\d{6,}\b", re.IGNORECASE),
+}
+_URGENCY_WORDS = ("urgent", "emergency", "asap")
+_URGENCY_RE    = re.compile(r"\b(" + "|".join(_URGENCY_WORDS) + r")\b", re.IGNORECASE)
+
+def _keyword_hit(text, lower, words, rx):
+    # Most messages contain none of the words, so a substring scan rejects
+    # them; the regex only runs to confirm word boundaries on a candidate.
+    # Non-ASCII text skips the reject: IGNORECASE folds "İ" to "i", lower() doesn't.
+    if text.isascii() and not any(w in lower for w in words):
+        return False
+    return rx.search(text) is not None
 
 def OpenAIModerationMiddleware(state):
-    flagged = [r"\b(bomb|weapon|kill|suicide|abuse)\b", r"\b(hack|exploit|injection)\b"]
-    text = state.get("raw_message", "")
-    for p in flagged:
-        if re.search(p, text, re.IGNORECASE):
-            _log("Moderation", "Flagged")
-            return {"moderation_flag": True, "status": "ESCALATE"}
+    if _scan(state)["moderation_hit"]:
+        _log("Moderation", "Flagged")
+        return {"moderation_flag": True, "status": "ESCALATE"}
     _log("Moderation", "Cleared")
     return {"moderation_flag": False}
 
 def PIIMiddleware(state):
-    rules = {
-        "ssn":   re.compile(r"\b\d{3}-\d{2}-\d{4}\b"),
-        "dob":   re.compile(r"\b\d{1,2}/\d{1,2}/\d{4}\b"),
-        "phone": re.compile(r"\b\(?\d{3}\)?[\s\-]\d{3}[\s\-]\d{4}\b"),
-        "email": re.compile(r"\b[\w.+-]+@[\w-]+\.\w+\b"),
-        "mrn":   re.compile(r"\bMRN[:\s]?\d{6,}\b", re.IGNORECASE),
-    }
-    found = [n for n, p in rules.items() if p.search(state.get("raw_message", ""))]
+    found = _scan(state)["pii_fields"]
     if found:
-        _log("PII", f"Detected field types: {found}")
+        _log("PII", "Detected field types: %s", found)
         return {"pii_detected": True, "pii_fields": found}
     return {"pii_detected": False, "pii_fields": []}
 
@@ -108,7 +157,7 @@ def ContextEditingMiddleware(state):
     if len(text) > MAX_CHARS:
         text = text[:MAX_CHARS] + " [TRIMMED]"
     entities = dict(state.get("extracted_entities") or {})
-    if re.search(r"\b(urgent|emergency|asap)\b", text, re.IGNORECASE):
+    if _scan(state)["urgency"]:
         entities["urgency"] = "high"
     return {"raw_message": text, "extracted_entities": entities}
 
@@ -127,19 +176,19 @@ def HumanInTheLoopMiddleware(state):
     }
     reason = triggers.get(state.get("intent", ""))
     if reason:
-        _log("HITL", f"Required — {reason}")
+        _log("HITL", "Required — %s", reason)
         return {"hitl_required": True, "hitl_reason": reason}
     return {"hitl_required": False}
 
 def ModelFallbackMiddleware(primary_fn, fallback_fn):
-    def _wrapped(state):
+    async def _wrapped(state):
         try:
-            r = primary_fn(state)
+            r = await primary_fn(state)
             _log("ModelFallback", "Primary succeeded")
             return r
         except Exception as exc:
-            _log("ModelFallback", f"Primary failed ({exc.__class__.__name__}), using fallback")
-            return fallback_fn(state)
+            log.warning("[MIDDLEWARE:ModelFallback] Primary failed (%s), using fallback", exc.__class__.__name__)
+            return await fallback_fn(state)
     return _wrapped
 
 
@@ -153,28 +202,108 @@ _INTENT_PATTERNS = {
     "prep_instructions": [r"\b(prep|preparation|prepare|instructions?)\b.*\b(mri|ct|scan|colonoscopy|endoscopy|blood test|lab)\b", r"\b(fasting|fast)\b"],
 }
 
+# One compiled alternation per intent, checked in the order above
+_INTENT_RES = [
+    (intent, re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE))
+    for intent, patterns in _INTENT_PATTERNS.items()
+]
+
+# Literal entity keywords are matched in one Aho-Corasick pass over the
+# lowercased text; only the patterns that need regex features stay regexes
+_ENTITY_KEYWORDS = {
+    "date_mentions": ("monday", "tuesday", "wednesday", "thursday", "friday", "tomorrow", "today"),
+    "time_mentions": ("morning", "afternoon", "evening", "noon"),
+    "procedures":    ("mri", "ct scan", "xray", "x-ray", "ultrasound", "colonoscopy", "endoscopy",
+                      "blood test", "lab work", "imaging", "surgery"),
+}
+_ENTITY_AC = ahocorasick.Automaton()
+for _bucket, _words in _ENTITY_KEYWORDS.items():
+    for _w in _words:
+        _ENTITY_AC.add_word(_w, (_bucket, len(_w)))
+_ENTITY_AC.make_automaton()
+
+_ENTITY_RES = {
+    "date_mentions": re.compile(r"\b(?:next\s+\w+|\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)\b", re.IGNORECASE),
+    "time_mentions": re.compile(r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b", re.IGNORECASE),
+}
+
 def classify_intent(text):
-    t = text.lower()
-    for intent, patterns in _INTENT_PATTERNS.items():
-        for p in patterns:
-            if re.search(p, t):
-                return intent
+    for intent, rx in _INTENT_RES:
+        if rx.search(text):
+            return intent
     return "unknown"
 
+def _is_word(c):
+    return c.isalnum() or c == "_"
+
 def extract_entities(text):
+    low = text.lower()
+    if len(low) != len(text):   # e.g. "İ" lowercases to two chars; keep offsets aligned
+        low = "".join(c.lower()[0] for c in text)
+
+    spans = {}
+    for end, (bucket, n) in _ENTITY_AC.iter(low):
+        start, end = end - n + 1, end + 1
+        # Same \b rule the regexes apply
+        if (start == 0 or not _is_word(low[start-1])) and (end == len(low) or not _is_word(low[end])):
+            spans.setdefault(bucket, []).append((start, end))
+    for bucket, rx in _ENTITY_RES.items():
+        for m in rx.finditer(text):
+            spans.setdefault(bucket, []).append(m.span())
+
+    # Leftmost, longest, non-overlapping: what re.findall over one alternation
+    # returned (so "next monday" stays one mention), in original casing
     entities = {}
-    date_re = re.compile(r"\b(monday|tuesday|wednesday|thursday|friday|next\s+\w+|tomorrow|today|\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?)\b", re.IGNORECASE)
-    time_re = re.compile(r"\b(\d{1,2}(?::\d{2})?\s*(?:am|pm)|morning|afternoon|evening|noon)\b", re.IGNORECASE)
-    proc_re = re.compile(r"\b(mri|ct scan|x-?ray|ultrasound|colonoscopy|endoscopy|blood test|lab work|imaging|surgery)\b", re.IGNORECASE)
-    if d  := date_re.findall(text): entities["date_mentions"] = d
-    if t  := time_re.findall(text): entities["time_mentions"] = t
-    if pr := proc_re.findall(text): entities["procedures"]    = pr
+    for bucket in _ENTITY_KEYWORDS:
+        last = -1
+        for start, end in sorted(spans.get(bucket, ()), key=lambda sp: (sp[0], -sp[1])):
+            if start >= last:
+                entities.setdefault(bucket, []).append(text[start:end])
+                last = end
     return entities
 
 def find_missing_fields(intent, entities):
     required = {"reschedule": ["date_mentions"], "cancel": [], "prep_instructions": ["procedures"], "unknown": []}
     return [f for f in required.get(intent, []) if not entities.get(f)]
 
+_SCAN_CACHE_MAX_LEN = 512   # longer messages are one-offs: scanned, not cached
+
+def _scan_uncached(text):
+    # Everything past MAX_CHARS is trimmed before the LLM sees it, so no
+    # check needs to walk the tail of an oversized message
+    text  = text[:MAX_CHARS]
+    lower = text.lower()
+    return (
+        _keyword_hit(text, lower, _MOD_WORDS, _MOD_RE),
+        tuple(n for n, p in _PII_RULES.items() if p.search(text)),
+        _keyword_hit(text, lower, _URGENCY_WORDS, _URGENCY_RE),
+        classify_intent(text),
+        tuple((k, tuple(v)) for k, v in extract_entities(text).items()),
+    )
+
+# Hashable tuples so repeated phrasings skip the regex work entirely
+_scan_cached = functools.lru_cache(maxsize=4096)(_scan_uncached)
+
+def scan_message(text):
+    """Run every regex check over the message once.
+
+    All checks see only the MAX_CHARS prefix that ContextEditingMiddleware
+    keeps. PII still runs every rule, since callers report which field
+    types were found.
+    """
+    scan = _scan_cached(text) if len(text) < _SCAN_CACHE_MAX_LEN else _scan_uncached(text)
+    moderation_hit, pii_fields, urgency, intent, entities = scan
+    return {
+        "moderation_hit": moderation_hit,
+        "pii_fields":     list(pii_fields),
+        "urgency":        urgency,
+        "intent":         intent,
+        "entities":       {k: list(v) for k, v in entities},
+    }
+
+def _scan(state):
+    return state.get("scan") or scan_message(state.get("raw_message", ""))
+
 
 # ═══════════════════════════════════════════════════════════════════
 # GPT RESPONSE GENERATION
@@ -186,32 +315,196 @@ Help patients with bookings, rescheduling, cancellations, and procedure prep ins
 - Never confirm bookings yourself — say staff will follow up.
 - No greetings or sign-offs."""
 
-def generate_response(state):
+# System message dict shared by every reply call
+_SYSTEM_MSG = {"role": "system", "content": _SYSTEM}
+
+def _prompt_details(entities, missing):
+    # The optional lines every template shares, each with its leading newline
+    dates, procs = entities.get("date_mentions"), entities.get("procedures")
+    return ((f"\nDate: {', '.join(dates)}" if dates else "")
+            + (f"\nProcedure: {', '.join(procs)}" if procs else "")
+            + (f"\nMissing info needed: {', '.join(missing)}" if missing else ""))
+
+_ASK_MISSING = "Politely ask for missing info."
+_ACK_STAFF   = "Acknowledge and say staff will confirm."
+
+# One prompt builder per intent, picked once instead of walking an if/elif chain
+_TEMPLATES = {
+    "prep_instructions": lambda s: f"{s['request']}Intent: prep_instructions{s['details']}\nGive detailed accurate prep instructions.",
+    "reschedule":        lambda s: f"{s['request']}Intent: reschedule{s['details']}\n{_ASK_MISSING if s['missing'] else _ACK_STAFF}",
+    "cancel":            lambda s: f"{s['request']}Intent: cancel{s['details']}\n{_ASK_MISSING if s['missing'] else _ACK_STAFF}",
+    "unknown":           lambda s: f"{s['request']}Intent: {s['intent']}{s['details']}\n{_ASK_MISSING if s['missing'] else 'Clarify what they need.'}",
+}
+
+def _build_prompt(state, include_request=True):
+    # include_request=False leaves out the patient's own words, so the prompt
+    # (and any cached reply) depends only on intent, entities and missing fields
+    intent  = state.get("intent", "unknown")
+    missing = state.get("missing_fields", [])
+    return _TEMPLATES.get(intent, _TEMPLATES["unknown"])({
+        "request": f"Patient request: {state.get('raw_message', '')}\n" if include_request else "",
+        "intent":  intent,
+        "missing": missing,
+        "details": _prompt_details(state.get("extracted_entities", {}), missing),
+    })
+
+async def generate_response(state):
     intent   = state.get("intent", "unknown")
     entities = state.get("extracted_entities", {})
     missing  = state.get("missing_fields", [])
-    raw_msg  = state.get("raw_message", "")
-
-    parts = [f"Patient request: {raw_msg}", f"Intent: {intent}"]
-    if entities.get("date_mentions"): parts.append(f"Date: {', '.join(entities['date_mentions'])}")
-    if entities.get("procedures"):    parts.append(f"Procedure: {', '.join(entities['procedures'])}")
-    if missing:                       parts.append(f"Missing info needed: {', '.join(missing)}")
-    if intent == "prep_instructions": parts.append("Give detailed accurate prep instructions.")
-    elif missing:                     parts.append("Politely ask for missing info.")
-    elif intent in ("reschedule","cancel"): parts.append("Acknowledge and say staff will confirm.")
-    else:                             parts.append("Clarify what they need.")
-
-    resp = _openai.chat.completions.create(
+
+    # Clarification replies (something is missing) are near-identical for a
+    # given intent/entities/missing combination, so they are served from cache.
+    # Their prompt is built from the key fields alone so one patient's words
+    # can never reach another; messages carrying PII are never cached at all.
+    cacheable = bool(missing) and not state.get("pii_detected")
+    key = (intent, _canonical_entities(entities), tuple(missing)) if cacheable else None
+    if key is not None:
+        hit = _RESP_CACHE.get(key)
+        if hit and time.monotonic() - hit[0] < _CACHE_TTL:
+            return {"draft_response": hit[1]}   # no API call made
+
+    prompt = _build_prompt(state, include_request=key is None)
+    reply  = await _coalescer.submit(prompt) if BATCH_WINDOW_MS > 0 else await _complete(prompt)
+
+    if key is not None:
+        _RESP_CACHE.pop(key, None)
+        if len(_RESP_CACHE) >= _RESP_CACHE_MAX:
+            _RESP_CACHE.pop(next(iter(_RESP_CACHE)))
+        _RESP_CACHE[key] = (time.monotonic(), reply)
+    return {"draft_response": reply, "call_count": state.get("call_count",0)+1}
+
+_RESP_CACHE: Dict[tuple, tuple] = {}   # key -> (stored_at, reply), oldest first
+_RESP_CACHE_MAX = 256
+_CACHE_TTL      = 300   # seconds
+
+def _canonical_entities(entities):
+    return tuple(sorted((k, v if isinstance(v, str) else tuple(v)) for k, v in entities.items()))
+
+async def _complete(prompt):
+    resp = await _openai.chat.completions.create(
         model=MODEL,
-        messages=[{"role":"system","content":_SYSTEM},{"role":"user","content":"\n".join(parts)}],
+        messages=[_SYSTEM_MSG, {"role":"user","content":prompt}],
         temperature=0.4, max_tokens=300,
     )
-    return {"draft_response": resp.choices[0].message.content.strip(), "call_count": state.get("call_count",0)+1}
+    return resp.choices[0].message.content.strip()
+
+async def stream_completion(prompt):
+    """Yield reply text deltas as OpenAI produces them."""
+    stream = await _openai.chat.completions.create(
+        model=MODEL,
+        messages=[_SYSTEM_MSG, {"role":"user","content":prompt}],
+        temperature=0.4, max_tokens=300, stream=True,
+    )
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+_BATCH_SYSTEM = _SYSTEM + """
+You will receive several numbered, independent patient requests. Answer each one on its own.
+Return a JSON object {"replies": [...]} with exactly one reply string per request, in order."""
+
+class BatchCoalescer:
+    """Coalesce concurrent prompts into one chat completion.
+
+    Prompts queued within ``window`` seconds (or until ``max_batch`` are
+    waiting) are sent as a single request that returns a JSON array of
+    replies, which are handed back to each caller by position. If the batch
+    call fails or its output doesn't parse, every prompt is retried on its
+    own.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window    = window
+        self.max_batch = max_batch
+        self._loop     = None
+        self._queue    = None
+        self._tasks    = set()   # strong refs so running tasks aren't garbage-collected
+
+    def _spawn(self, coro):
+        task = self._loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, prompt):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop  = loop
+            self._queue = asyncio.Queue(maxsize=self.max_batch * 4)
+            self._spawn(self._collect())
+        fut = loop.create_future()
+        await self._queue.put((prompt, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch    = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._spawn(self._dispatch(batch))
+
+    async def _dispatch(self, batch):
+        prompts = [p for p, _ in batch]
+        try:
+            replies = await self._complete_batch(prompts) if len(prompts) > 1 else [await _complete(prompts[0])]
+        except Exception as exc:
+            # A lone prompt was already sent on its own; retrying it would just
+            # double the calls before ModelFallback takes over
+            replies = (await asyncio.gather(*(_complete(p) for p in prompts), return_exceptions=True)
+                       if len(prompts) > 1 else [exc])
+        for (_, fut), reply in zip(batch, replies):
+            if fut.done():
+                continue
+            if isinstance(reply, BaseException):
+                fut.set_exception(reply)
+            else:
+                fut.set_result(reply)
+
+    async def _complete_batch(self, prompts):
+        numbered = "\n\n".join(f"Request {i + 1}:\n{p}" for i, p in enumerate(prompts))
+        resp = await _openai.chat.completions.create(
+            model=MODEL,
+            messages=[{"role":"system","content":_BATCH_SYSTEM},{"role":"user","content":numbered}],
+            temperature=0.4, max_tokens=300 * len(prompts),
+            response_format={"type": "json_object"},
+        )
+        replies = orjson.loads(resp.choices[0].message.content)["replies"]
+        if len(replies) != len(prompts) or not all(isinstance(r, str) for r in replies):
+            raise ValueError("Batch reply count mismatch")
+        return [r.strip() for r in replies]
+
+_coalescer = BatchCoalescer(BATCH_WINDOW_MS / 1000, MAX_BATCH)
 
-def fallback_response(state):
+async def fallback_response(state):
     return {"draft_response": f"Thank you. A team member will follow up shortly. You can also reach us at {CLINIC_EMAIL}.", "call_count": state.get("call_count",0)+1}
 
 
+_EMAIL_SYSTEM = f"""You are drafting a short, professional email on behalf of a patient to {CLINIC_NAME}.
+Return ONLY the email body — no subject line, no extra commentary.
+Sign off with the patient's name."""
+
+def _email_prompt(intent, name, phone, day, time_):
+    action = {"book":"book a new appointment","cancel":"cancel my appointment","reschedule":"reschedule my appointment"}.get(intent,"book a new appointment")
+    subj_label = {"book":"New Appointment Request","cancel":"Appointment Cancellation Request","reschedule":"Appointment Reschedule Request"}.get(intent,"Appointment Request")
+    user = f"""Draft an email to {CLINIC_EMAIL} to {action}.
+Patient name: {name}
+Patient phone: {phone}
+{'Appointment to ' + ('cancel' if intent=='cancel' else 'reschedule') + ':' if intent != 'book' else 'Preferred appointment:'}
+  Day:  {day}
+  Time: {time_}
+Clinic: {CLINIC_NAME}"""
+    return action, subj_label, user
+
+
 # ═══════════════════════════════════════════════════════════════════
 # LANGGRAPH NODES
 # ═══════════════════════════════════════════════════════════════════
@@ -224,15 +517,35 @@ def node_pii_check(state):          return PIIMiddleware(state)
 def node_context_edit(state):       return ContextEditingMiddleware(state)
 def node_call_limit_check(state):   return ToolCallLimitMiddleware(state)
 
-def node_intent_classify(state):
-    intent = classify_intent(state.get("raw_message",""))
-    print(f"  [NLU] Intent: {intent}")
-    return {"intent": intent, "call_count": state.get("call_count",0)+1}
-
-def node_entity_extract(state):
+def node_nlu(state):
+    # Intent and entities are both read off the one scan. Neither is an LLM
+    # call, so neither counts toward MAX_CALLS.
+    scan     = _scan(state)
     existing = dict(state.get("extracted_entities") or {})
-    existing.update(extract_entities(state.get("raw_message","")))
-    return {"extracted_entities": existing, "call_count": state.get("call_count",0)+1}
+    existing.update(scan["entities"])
+    log.debug("NLU intent=%s", scan["intent"])
+    return {"intent": scan["intent"], "extracted_entities": existing}
+
+# Run in order by node_prefilter; the first ESCALATE stops the chain.
+# Truncation comes first so every later stage sees the bounded message.
+_PREFILTER_STAGES = (
+    node_context_edit, node_moderation_check, node_pii_check,
+    node_call_limit_check, node_nlu,
+)
+
+def node_prefilter(state):
+    # Each stage is an O(1) read of the one scan, so they run back to back in
+    # a single node instead of paying a graph hop apiece
+    scan   = scan_message(state.get("raw_message",""))
+    state  = {**state, "scan": scan}
+    update = {"scan": scan}
+    for stage in _PREFILTER_STAGES:
+        result = stage(state)
+        state.update(result)
+        update.update(result)
+        if result.get("status") == "ESCALATE":
+            break
+    return update
 
 def node_missing_field_check(state):
     missing = find_missing_fields(state.get("intent","unknown"), state.get("extracted_entities",{}))
@@ -246,7 +559,9 @@ def node_hitl_review(state):
     return {"hitl_approved": None}   # frontend will confirm
 
 _response_node = ModelFallbackMiddleware(generate_response, fallback_response)
-def node_response_generate(state):  return _response_node(state)
+async def node_response_generate(state):  return await _response_node(state)
+
+_MODERATED_REPLY = "We were unable to process your message. Please contact our office directly."
 
 def node_finalize(state):
     moderated  = state.get("moderation_flag", False)
@@ -258,7 +573,7 @@ def node_finalize(state):
 
     if status == "ESCALATE" or moderated:
         final_status = "ESCALATE"
-        final_resp   = "We were unable to process your message. Please contact our office directly." if moderated else f"Your request requires staff attention. {error}"
+        final_resp   = _MODERATED_REPLY if moderated else f"Your request requires staff attention. {error}"
     elif status == "NEED_INFO" or missing or intent == "unknown":
         final_status = "NEED_INFO"
         final_resp   = draft
@@ -266,7 +581,7 @@ def node_finalize(state):
         final_status = "READY"
         final_resp   = draft
 
-    print(f"  [Finalize] Status: {final_status}")
+    log.debug("Finalize status=%s", final_status)
     return {"status": final_status, "final_response": final_resp}
 
 
@@ -274,20 +589,14 @@ def node_finalize(state):
 # LANGGRAPH GRAPH
 # ═══════════════════════════════════════════════════════════════════
 
-def route_after_moderation(state):     return "escalate" if state.get("moderation_flag") else "continue"
-def route_after_call_limit(state):     return "escalate" if state.get("status")=="ESCALATE" else "continue"
+def route_after_prefilter(state):      return "escalate" if state.get("status")=="ESCALATE" else "continue"
 def route_after_missing(state):        return "need_info" if (state.get("missing_fields") or state.get("intent")=="unknown") else "continue"
 def route_after_hitl_gate(state):      return "hitl" if state.get("hitl_required") else "generate"
 
 def build_graph():
     g = StateGraph(AppointmentState)
     g.add_node("input_validation",    node_input_validation)
-    g.add_node("moderation_check",    node_moderation_check)
-    g.add_node("pii_check",           node_pii_check)
-    g.add_node("context_edit",        node_context_edit)
-    g.add_node("call_limit_check",    node_call_limit_check)
-    g.add_node("intent_classify",     node_intent_classify)
-    g.add_node("entity_extract",      node_entity_extract)
+    g.add_node("prefilter",           node_prefilter)
     g.add_node("missing_field_check", node_missing_field_check)
     g.add_node("hitl_gate",           node_hitl_gate)
     g.add_node("hitl_review",         node_hitl_review)
@@ -295,17 +604,12 @@ def build_graph():
     g.add_node("finalize",            node_finalize)
 
     g.set_entry_point("input_validation")
-    g.add_edge("input_validation",    "moderation_check")
-    g.add_edge("pii_check",           "context_edit")
-    g.add_edge("context_edit",        "call_limit_check")
-    g.add_edge("intent_classify",     "entity_extract")
-    g.add_edge("entity_extract",      "missing_field_check")
+    g.add_edge("input_validation",    "prefilter")
     g.add_edge("hitl_review",         "response_generate")
     g.add_edge("response_generate",   "finalize")
     g.add_edge("finalize",            END)
 
-    g.add_conditional_edges("moderation_check",    route_after_moderation, {"continue":"pii_check",          "escalate":"finalize"})
-    g.add_conditional_edges("call_limit_check",    route_after_call_limit, {"continue":"intent_classify",    "escalate":"finalize"})
+    g.add_conditional_edges("prefilter",           route_after_prefilter,  {"continue":"missing_field_check","escalate":"finalize"})
     g.add_conditional_edges("missing_field_check", route_after_missing,    {"continue":"hitl_gate",          "need_info":"response_generate"})
     g.add_conditional_edges("hitl_gate",           route_after_hitl_gate,  {"generate":"response_generate",  "hitl":"hitl_review"})
 
@@ -313,28 +617,206 @@ def build_graph():
 
 _graph = build_graph()
 
+def _run_prefilters(state):
+    """Run every node ahead of response_generate as straight-line Python.
+
+    Returns the updated state and whether a reply still has to be generated
+    (False once the prefilter escalates). Routing uses the same route_*
+    functions as build_graph().
+    """
+    state = dict(state)
+    state.update(node_input_validation(state))
+    state.update(node_prefilter(state))
+    if route_after_prefilter(state) == "escalate":
+        return state, False
+    state.update(node_missing_field_check(state))
+    if route_after_missing(state) == "continue":
+        state.update(node_hitl_gate(state))
+    return state, True
+
+async def _fast_path(state):
+    """Run the graph's nodes as straight-line Python.
+
+    Each node is only microseconds of work, so LangGraph's per-step dispatch
+    and state merging dominate. Returns None when the request needs HITL
+    review; the caller then runs the full graph.
+    """
+    state, needs_reply = _run_prefilters(state)
+    if needs_reply:
+        if route_after_hitl_gate(state) == "hitl":
+            return None
+        state.update(await node_response_generate(state))
+    state.update(node_finalize(state))
+    return state
+
+
+# ═══════════════════════════════════════════════════════════════════
+# APPOINTMENT STORE
+# ═══════════════════════════════════════════════════════════════════
+
+# SQLite in WAL mode: lookups and updates touch single rows, and readers never
+# block the writer. Each update commits atomically, so a crash mid-write cannot
+# corrupt the store. appointments.json only seeds a fresh database.
+_APPT_JSON_PATH = os.path.join(_BASE_DIR, "appointments.json")
+_APPT_DB_PATH   = os.path.join(_BASE_DIR, "appointments.db")
+_APPT_COLUMNS   = "id, date, time, type, doctor, phone"
+
+_db_local = threading.local()
+
+def _db():
+    # One connection per thread; handlers reach the store via asyncio.to_thread
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(_APPT_DB_PATH, timeout=10.0)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _db_local.conn = conn
+    return conn
+
+@contextlib.contextmanager
+def _write_txn(conn):
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+    # (threads or uvicorn workers) wait on the busy timeout in turn instead of
+    # failing when a read transaction tries to upgrade
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def _init_db():
+    conn = _db()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS patients (
+            name     TEXT PRIMARY KEY,
+            name_key TEXT NOT NULL      -- name.lower(); NOCASE would only fold ASCII
+        );
+        CREATE TABLE IF NOT EXISTS appointments (
+            id      TEXT PRIMARY KEY,
+            patient TEXT NOT NULL REFERENCES patients(name),
+            date    TEXT,
+            time    TEXT,
+            type    TEXT,
+            doctor  TEXT,
+            phone   TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_patients_name_key   ON patients(name_key);
+        CREATE INDEX IF NOT EXISTS idx_appointments_patient ON appointments(patient);
+    """)
+    if conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone() or not os.path.exists(_APPT_JSON_PATH):
+        return
+    with open(_APPT_JSON_PATH, "rb") as f:
+        all_appointments = orjson.loads(f.read())
+    with _write_txn(conn):
+        # Re-checked under the lock: every worker imports this module at once
+        if conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone():
+            return
+        for name, appointments in all_appointments.items():
+            conn.execute("INSERT INTO patients (name, name_key) VALUES (?, ?)", (name, name.lower()))
+            conn.executemany(
+                f"INSERT INTO appointments (patient, {_APPT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(name, a["id"], a.get("date"), a.get("time"), a.get("type"), a.get("doctor"), a.get("phone")) for a in appointments],
+            )
+    log.info("Store imported %d patients from appointments.json", len(all_appointments))
+
+def _find_appointments(name):
+    conn = _db()
+    row  = conn.execute("SELECT name FROM patients WHERE name_key = ? ORDER BY rowid", (name.lower(),)).fetchone()
+    if not row:
+        return None, []
+    rows = conn.execute(f"SELECT {_APPT_COLUMNS} FROM appointments WHERE patient = ? ORDER BY rowid", (row["name"],)).fetchall()
+    return row["name"], [dict(r) for r in rows]
+
+def _update_appointment(name, apt_id, new_date, new_time):
+    conn = _db()
+    with _write_txn(conn):
+        row = conn.execute("SELECT name FROM patients WHERE name_key = ? ORDER BY rowid", (name.lower(),)).fetchone()
+        if not row:
+            return None, "Patient not found"
+        cur = conn.execute("UPDATE appointments SET date = ?, time = ? WHERE id = ? AND patient = ?", (new_date, new_time, apt_id, row["name"]))
+        if cur.rowcount == 0:
+            return None, "Appointment not found"
+        updated = conn.execute(f"SELECT {_APPT_COLUMNS} FROM appointments WHERE id = ?", (apt_id,)).fetchone()
+    return dict(updated), None
+
+_init_db()
+
 
 # ═══════════════════════════════════════════════════════════════════
-# FLASK ROUTES
+# QUART ROUTES
 # ═══════════════════════════════════════════════════════════════════
 
+def jsonify_fast(obj):
+    return Response(orjson.dumps(obj), mimetype="application/json")
+
+async def _request_json():
+    body = await request.get_data()
+    if not body:
+        return {}
+    try:
+        return orjson.loads(body) or {}
+    except orjson.JSONDecodeError:
+        abort(400)
+
 @app.route("/")
-def index():
-    return send_from_directory(".", "frontend.html")
+async def index():
+    return await send_from_directory(_BASE_DIR, "frontend.html")
 
 @app.route("/api/chat", methods=["POST"])
-def api_chat():
+async def api_chat():
     """
     Receives: { message: str }
     Returns:  { reply: str, status: str, hitl_required: bool, route: [...] }
     """
-    data    = request.get_json() or {}
+    data    = await _request_json()
+    message = data.get("message", "").strip()
+    run_id  = _new_run_id()
+
+    log.debug("API /chat run=%s len=%d", run_id, len(message))
+
+    if (result := _short_circuit(message)) is not None:
+        return jsonify_fast(_chat_payload(result, run_id))
+
+    initial = {
+        "run_id":             run_id,
+        "raw_message":        message,
+        "route_taken":        [],
+        "call_count":         0,
+        "extracted_entities": {},
+    }
+    try:
+        result = await _fast_path(initial)
+    except Exception as exc:
+        log.warning("API fast path failed (%s), using graph", exc.__class__.__name__)
+        result = None
+    if result is None:
+        result = await _graph.ainvoke(initial)
+
+    return jsonify_fast(_chat_payload(result, run_id))
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+async def api_chat_stream():
+    """
+    Receives: { message: str }   (POST body, never the URL: it may carry PII)
+    Returns:  text/event-stream of { token: str } events, then a "done" event
+              carrying the same body as /api/chat
+    """
+    data    = await _request_json()
     message = data.get("message", "").strip()
-    run_id  = f"APPT-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8].upper()}"
+    run_id  = _new_run_id()
+
+    log.debug("API /chat/stream run=%s len=%d", run_id, len(message))
 
-    print(f"\n  [API] /chat  run={run_id}  len={len(message)}")
+    if (result := _short_circuit(message)) is not None:
+        return Response(_sse(_chat_payload(result, run_id), event="done"), mimetype="text/event-stream")
 
-    result = _graph.invoke({
+    # Moderation, PII and NLU all finish before the first byte is sent; only
+    # the draft itself is streamed
+    state, needs_reply = _run_prefilters({
         "run_id":             run_id,
         "raw_message":        message,
         "route_taken":        [],
@@ -342,7 +824,46 @@ def api_chat():
         "extracted_entities": {},
     })
 
-    return jsonify({
+    async def generate():
+        nonlocal state
+        if needs_reply:
+            if route_after_hitl_gate(state) == "hitl":
+                state.update(node_hitl_review(state))
+            tokens = []
+            try:
+                async for delta in stream_completion(_build_prompt(state)):
+                    tokens.append(delta)
+                    yield _sse({"token": delta})
+                _log("ModelFallback", "Primary succeeded")
+                state.update({"draft_response": "".join(tokens).strip(), "call_count": state.get("call_count",0)+1})
+            except Exception as exc:
+                # The done event's reply replaces any tokens already shown
+                log.warning("[MIDDLEWARE:ModelFallback] Primary failed (%s), using fallback", exc.__class__.__name__)
+                state.update(await fallback_response(state))
+        state.update(node_finalize(state))
+        yield _sse(_chat_payload(state, run_id), event="done")
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _short_circuit(message):
+    """Answer empty and obviously moderated messages without the pipeline.
+
+    Returns a result dict shaped like the graph's, or None to run it.
+    """
+    if not message:
+        return {"status": "NEED_INFO", "final_response": "Please enter a message."}
+    text = message[:MAX_CHARS]
+    if _keyword_hit(text, text.lower(), _MOD_WORDS, _MOD_RE):
+        log.debug("API short-circuit: moderation hit")
+        return {"status": "ESCALATE", "final_response": _MODERATED_REPLY}
+    return None
+
+def _new_run_id():
+    return f"APPT-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8].upper()}"
+
+def _chat_payload(result, run_id):
+    return {
         "reply":        result.get("final_response", ""),
         "status":       result.get("status", "READY"),
         "hitl_required":result.get("hitl_required", False),
@@ -350,125 +871,176 @@ def api_chat():
         "intent":       result.get("intent", "unknown"),
         "route":        result.get("route_taken", []),
         "run_id":       run_id,
-    })
+    }
+
+def _sse(data, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {orjson.dumps(data).decode()}\n\n"
 
 
 @app.route("/api/email", methods=["POST"])
-def api_email():
+async def api_email():
     """
     Receives: { intent, name, phone, day, time }
     Returns:  { subject: str, body: str }
     Calls GPT-4o-mini to draft the email.
     """
-    data   = request.get_json() or {}
+    data   = await _request_json()
     intent = data.get("intent", "book")
     name   = data.get("name", "")
     phone  = data.get("phone", "")
     day    = data.get("day", "")
     time_  = data.get("time", "")
 
-    print(f"\n  [API] /email  intent={intent}  name=[redacted]")
-
-    action = {"book":"book a new appointment","cancel":"cancel my appointment","reschedule":"reschedule my appointment"}.get(intent,"book a new appointment")
-    subj_label = {"book":"New Appointment Request","cancel":"Appointment Cancellation Request","reschedule":"Appointment Reschedule Request"}.get(intent,"Appointment Request")
-
-    system = f"""You are drafting a short, professional email on behalf of a patient to {CLINIC_NAME}.
-Return ONLY the email body — no subject line, no extra commentary.
-Sign off with the patient's name."""
+    log.debug("API /email intent=%s name=[redacted]", intent)
 
-    user = f"""Draft an email to {CLINIC_EMAIL} to {action}.
-Patient name: {name}
-Patient phone: {phone}
-{'Appointment to ' + ('cancel' if intent=='cancel' else 'reschedule') + ':' if intent != 'book' else 'Preferred appointment:'}
-  Day:  {day}
-  Time: {time_}
-Clinic: {CLINIC_NAME}"""
+    action, subj_label, user = _email_prompt(intent, name, phone, day, time_)
 
     try:
-        resp = _openai.chat.completions.create(
+        resp = await _openai.chat.completions.create(
             model=MODEL,
-            messages=[{"role":"system","content":system},{"role":"user","content":user}],
+            messages=[{"role":"system","content":_EMAIL_SYSTEM},{"role":"user","content":user}],
             temperature=0.3, max_tokens=300,
         )
         body = resp.choices[0].message.content.strip()
     except Exception as e:
         body = f"Dear {CLINIC_NAME} Team,\n\nI would like to {action}.\n\nPatient: {name}\nPhone: {phone}\nDay: {day}\nTime: {time_}\n\nPlease contact me to confirm.\n\nThank you,\n{name}"
 
-    return jsonify({
+    return jsonify_fast({
         "subject": f"{subj_label} — {name}",
         "body":    body,
     })
 
 
+@app.route("/api/email/bulk", methods=["POST"])
+async def api_email_bulk():
+    """
+    Receives: { emails: [{ intent, name, phone, day, time }, ...] }
+    Returns:  { batch_id: str, status: str, subjects: [...] }
+    Queues non-interactive drafts (reminders, follow-ups) on the OpenAI
+    Batch API — about half the cost of /api/email, finished within 24h.
+    Poll GET /api/email/bulk/<batch_id> for the bodies.
+    """
+    data   = await _request_json()
+    emails = data.get("emails") or []
+    if not isinstance(emails, list) or not all(isinstance(e, dict) for e in emails):
+        return jsonify_fast({"error": "emails must be a list of objects"}), 400
+    log.debug("API /email/bulk count=%d", len(emails))
+
+    if not emails:
+        return jsonify_fast({"error": "No emails to draft"})
+
+    lines, subjects = [], []
+    for i, e in enumerate(emails):
+        name = e.get("name", "")
+        _, subj_label, user = _email_prompt(e.get("intent", "book"), name, e.get("phone", ""), e.get("day", ""), e.get("time", ""))
+        subjects.append(f"{subj_label} — {name}")
+        lines.append(orjson.dumps({
+            "custom_id": str(i),
+            "method":    "POST",
+            "url":       "/v1/chat/completions",
+            "body": {
+                "model":       MODEL,
+                "messages":    [{"role":"system","content":_EMAIL_SYSTEM},{"role":"user","content":user}],
+                "temperature": 0.3,
+                "max_tokens":  300,
+            },
+        }))
+
+    try:
+        batch_file = await _openai.files.create(file=("email_bulk.jsonl", b"\n".join(lines)), purpose="batch")
+        batch      = await _openai.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    except Exception as e:
+        return jsonify_fast({"error": str(e)})
+
+    return jsonify_fast({"batch_id": batch.id, "status": batch.status, "subjects": subjects})
+
+
+@app.route("/api/email/bulk/<batch_id>", methods=["GET"])
+async def api_email_bulk_status(batch_id):
+    """
+    Returns: { batch_id: str, status: str, emails: [{ index, body | error }] }
+    emails is only present once the batch has completed, with one entry per
+    queued draft in order.
+    """
+    try:
+        batch = await _openai.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            return jsonify_fast({"batch_id": batch_id, "status": batch.status})
+        # Successful requests land in output_file_id, failed ones in error_file_id
+        file_ids = [f for f in (batch.output_file_id, batch.error_file_id) if f]
+        contents = await asyncio.gather(*(_openai.files.content(f) for f in file_ids))
+    except Exception as e:
+        return jsonify_fast({"batch_id": batch_id, "error": str(e)})
+
+    found = {}
+    for content in contents:
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            row  = orjson.loads(line)
+            idx  = int(row["custom_id"])
+            resp = row.get("response") or {}
+            if resp.get("status_code") == 200:
+                found[idx] = {"index": idx, "body": resp["body"]["choices"][0]["message"]["content"].strip()}
+            else:
+                err = row.get("error") or (resp.get("body") or {}).get("error") or {}
+                found[idx] = {"index": idx, "error": err.get("message", "Draft failed")}
+
+    counts  = batch.request_counts
+    total   = counts.total if counts else max(found, default=-1) + 1
+    results = [found.get(i) or {"index": i, "error": "No result returned"} for i in range(total)]
+
+    return jsonify_fast({"batch_id": batch_id, "status": batch.status, "emails": results})
+
+
 @app.route("/api/appointments", methods=["POST"])
-def api_appointments():
+async def api_appointments():
     """
     Receives: { name: str }
     Returns:  { found: bool, appointments: [...] }
     """
-    data = request.get_json() or {}
+    data = await _request_json()
     name = data.get("name", "").strip()
-    print(f"\n  [API] /appointments  name=[redacted]")
+    log.debug("API /appointments name=[redacted]")
 
     try:
-        json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "appointments.json")
-        with open(json_path) as f:
-            all_appointments = json.load(f)
+        matched_key, appointments = await asyncio.to_thread(_find_appointments, name)
     except Exception as e:
-        return jsonify({"found": False, "appointments": [], "error": str(e)})
-
-    matched_key = next((k for k in all_appointments if k.lower() == name.lower()), None)
+        return jsonify_fast({"found": False, "appointments": [], "error": str(e)})
 
     if not matched_key:
-        return jsonify({"found": False, "appointments": []})
+        return jsonify_fast({"found": False, "appointments": []})
 
-    return jsonify({
+    return jsonify_fast({
         "found":        True,
         "name":         matched_key,
-        "appointments": all_appointments[matched_key]
+        "appointments": appointments
     })
 
 
 @app.route("/api/appointments/update", methods=["POST"])
-def api_appointments_update():
+async def api_appointments_update():
     """
     Receives: { name, appointment_id, new_date, new_time }
-    Updates appointment in appointments.json.
+    Updates the appointment row in appointments.db.
     """
-    data     = request.get_json() or {}
+    data     = await _request_json()
     name     = data.get("name", "").strip()
     apt_id   = data.get("appointment_id", "").strip()
     new_date = data.get("new_date", "").strip()
     new_time = data.get("new_time", "").strip()
-    print(f"\n  [API] /appointments/update  id={apt_id}")
+    log.debug("API /appointments/update id=%s", apt_id)
 
     try:
-        json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "appointments.json")
-        with open(json_path) as f:
-            all_appointments = json.load(f)
-
-        matched_key = next((k for k in all_appointments if k.lower() == name.lower()), None)
-        if not matched_key:
-            return jsonify({"success": False, "error": "Patient not found"})
-
-        updated = None
-        for apt in all_appointments[matched_key]:
-            if apt["id"] == apt_id:
-                apt["date"] = new_date
-                apt["time"] = new_time
-                updated = apt
-                break
-
-        if not updated:
-            return jsonify({"success": False, "error": "Appointment not found"})
-
-        with open(json_path, "w") as f:
-            json.dump(all_appointments, f, indent=2)
+        updated, error = await asyncio.to_thread(_update_appointment, name, apt_id, new_date, new_time)
+        if error:
+            return jsonify_fast({"success": False, "error": error})
 
-        return jsonify({"success": True, "appointment": updated})
+        return jsonify_fast({"success": True, "appointment": updated})
 
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)})
+        return jsonify_fast({"success": False, "error": str(e)})
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -481,4 +1053,5 @@ if __name__ == "__main__":
     print(f"  http://localhost:8080")
     print(f"  Model : {MODEL}")
     print(f"{'='*55}\n")
-    app.run(debug=True, port=8080)
\ No newline at end of file
+    # Development only: production runs the ASGI app under uvicorn (see top)
+    app.run(debug=os.getenv("QUART_DEBUG") == "1", port=8080)
\ No newline at end of file